@@ -7,6 +7,9 @@ import uuid
 from datetime import datetime
 from typing import List, Dict, Any
 import logging
+from config import CHAT_CONFIG
+from prefetch import QuickReplyPrefetcher
+from session_manager import MessageHistory, SessionManager
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -176,25 +179,56 @@ st.markdown(
 )
 
 
+@st.cache_resource
+def get_session_manager() -> SessionManager:
+    """Process-wide session manager shared by all browser sessions"""
+    # Drop unused prefetches once a session is closed or replaced
+    return SessionManager(on_forget=get_prefetcher().cancel)
+
+
+@st.cache_resource
+def get_prefetcher() -> QuickReplyPrefetcher:
+    """Process-wide prefetcher for quick-reply answers"""
+    return QuickReplyPrefetcher(send_message_to_webhook)
+
+
+def create_welcome_message() -> Dict[str, Any]:
+    """Create the assistant's opening message"""
+    return {
+        "role": "assistant",
+        "content": CHAT_CONFIG["welcome_message"],
+        "timestamp": datetime.now(),
+    }
+
+
 def initialize_session_state():
     """Initialize session state variables"""
     if "messages" not in st.session_state:
-        st.session_state.messages = [
-            {
-                "role": "assistant",
-                "content": "Welcome to TROOPERS! So glad you're here! 😊\n\nTo get started and recommend the best team mix for your project, could you please tell me what kind of project or event you are planning? For example, is it a Café/Restaurant Service, Retail Promotion, Roadshow, Warehouse Operations, or something else? This helps me tailor the roles to your needs.",
-                "timestamp": datetime.now(),
-            }
-        ]
+        st.session_state.messages = MessageHistory([create_welcome_message()])
+    elif not isinstance(st.session_state.messages, MessageHistory):
+        # Sessions started before MessageHistory existed hold a plain list
+        st.session_state.messages = MessageHistory(st.session_state.messages)
 
     if "session_id" not in st.session_state:
         st.session_state.session_id = (
             f"session_{int(time.time())}_{str(uuid.uuid4())[:8]}"
         )
+        # Fetch the answers behind the quick-reply buttons in the background
+        get_prefetcher().start(
+            st.session_state.session_id, CHAT_CONFIG["quick_replies"]
+        )
 
     if "is_loading" not in st.session_state:
         st.session_state.is_loading = False
 
+    # Record activity and restore the history if it was spilled to disk
+    get_session_manager().activate(
+        st.session_state.session_id, st.session_state.messages
+    )
+    if not st.session_state.messages:
+        # The spilled copy was lost or expired
+        st.session_state.messages.append(create_welcome_message())
+
 
 def send_message_to_webhook(message: str, session_id: str) -> Dict[str, Any]:
     """Send message to n8n webhook and return response"""
@@ -311,10 +345,8 @@ def display_chat_message(message: Dict[str, Any], message_key: str):
             st.caption(f"TROOPERS Assistant • {format_timestamp(timestamp)}")
 
 
-def main():
-    """Main application function"""
-    initialize_session_state()
-
+def render_chat():
+    """Render the chat and process the latest user message"""
     # Minimal header
     st.markdown(
         """
@@ -341,6 +373,20 @@ def main():
     for i, message in enumerate(st.session_state.messages):
         display_chat_message(message, f"message_{i}")
 
+    # Quick replies for the project types offered in the welcome message
+    if len(st.session_state.messages) == 1 and not st.session_state.is_loading:
+        columns = st.columns(len(CHAT_CONFIG["quick_replies"]))
+        for i, (column, choice) in enumerate(
+            zip(columns, CHAT_CONFIG["quick_replies"])
+        ):
+            with column:
+                if st.button(choice, key=f"quick_reply_{i}", use_container_width=True):
+                    st.session_state.messages.append(
+                        {"role": "user", "content": choice, "timestamp": datetime.now()}
+                    )
+                    st.session_state.is_loading = True
+                    st.rerun()
+
     # Show minimal loading spinner
     if st.session_state.is_loading:
         with st.chat_message("assistant", avatar="🤖"):
@@ -376,10 +422,25 @@ def main():
     if st.session_state.is_loading and st.session_state.messages:
         latest_message = st.session_state.messages[-1]
         if latest_message["role"] == "user":
-            # Send message to webhook
-            response = send_message_to_webhook(
-                latest_message["content"], st.session_state.session_id
+            # Serve a prefetched quick-reply answer if there is one
+            response = None
+            prefetched = get_prefetcher().claim(
+                st.session_state.session_id,
+                latest_message["content"],
+                timeout=CHAT_CONFIG["timeout_seconds"],
             )
+            if prefetched is not None:
+                # Continue under the speculative session, whose agent memory
+                # already holds this exchange
+                speculative_session_id, response = prefetched
+                get_session_manager().discard(st.session_state.session_id)
+                st.session_state.session_id = speculative_session_id
+
+            # Send message to webhook
+            if response is None:
+                response = send_message_to_webhook(
+                    latest_message["content"], st.session_state.session_id
+                )
 
             # Add assistant response to chat
             assistant_message = {
@@ -416,14 +477,26 @@ def main():
         col1, col2 = st.columns(2)
         with col1:
             if st.button("Clear", type="secondary", use_container_width=True):
-                st.session_state.messages = [st.session_state.messages[0]]
+                st.session_state.messages = MessageHistory(
+                    st.session_state.messages[:1]
+                )
+                # The quick replies show again, so fetch fresh answers for them
+                get_prefetcher().start(
+                    st.session_state.session_id, CHAT_CONFIG["quick_replies"]
+                )
                 st.rerun()
         with col2:
             if st.button("New Session", type="secondary", use_container_width=True):
+                get_session_manager().discard(st.session_state.session_id)
                 st.session_state.session_id = (
                     f"session_{int(time.time())}_{str(uuid.uuid4())[:8]}"
                 )
-                st.session_state.messages = [st.session_state.messages[0]]
+                get_prefetcher().start(
+                    st.session_state.session_id, CHAT_CONFIG["quick_replies"]
+                )
+                st.session_state.messages = MessageHistory(
+                    st.session_state.messages[:1]
+                )
                 st.rerun()
 
         # Toggle session info display
@@ -438,6 +511,34 @@ def main():
             )
             st.text(f"Session: {st.session_state.session_id[:16]}...")
 
+            session_stats = get_session_manager().get_stats()
+            st.text(
+                f"Sessions: {session_stats['live_sessions']} live • "
+                f"{session_stats['idle_sessions']} idle • "
+                f"{session_stats['spilled_sessions']} spilled"
+            )
+            st.text(
+                f"Memory: {session_stats['live_bytes'] + session_stats['idle_bytes']:,} / "
+                f"{session_stats['memory_budget_bytes']:,} bytes"
+            )
+            st.text(f"On disk: {session_stats['spilled_bytes']:,} bytes")
+
+            prefetch_stats = get_prefetcher().get_stats()
+            st.text(
+                f"Quick replies: {prefetch_stats['hit_rate']:.0%} hit rate • "
+                f"{prefetch_stats['hits']} ready • "
+                f"{prefetch_stats['late_hits']} waited • "
+                f"{prefetch_stats['misses']} missed"
+            )
+            st.text(
+                f"Prefetches: {prefetch_stats['issued']} issued • "
+                f"{prefetch_stats['in_flight']} in flight • "
+                f"{prefetch_stats['pending']} pending • "
+                f"{prefetch_stats['cancelled']} cancelled • "
+                f"{prefetch_stats['expired']} expired • "
+                f"{prefetch_stats['wasted']} wasted"
+            )
+
             if st.button("Test Connection", type="secondary", use_container_width=True):
                 test_response = send_message_to_webhook(
                     "Connection test", st.session_state.session_id
@@ -449,5 +550,17 @@ def main():
                 st.json(st.session_state.messages[-1], expanded=False)
 
 
+def main():
+    """Main application function"""
+    initialize_session_state()
+    try:
+        render_chat()
+    finally:
+        # Runs on st.rerun() too, so the session is never spilled mid-run
+        get_session_manager().release(
+            st.session_state.session_id, st.session_state.messages
+        )
+
+
 if __name__ == "__main__":
     main()
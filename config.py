@@ -17,14 +17,43 @@ APP_CONFIG: Dict[str, Any] = {
     "initial_sidebar_state": "collapsed",
 }
 
+# Project types offered as quick replies and listed in the welcome message
+QUICK_REPLIES = [
+    "Café/Restaurant Service",
+    "Retail Promotion",
+    "Roadshow",
+    "Warehouse Operations",
+]
+
 # Chat Configuration
 CHAT_CONFIG: Dict[str, Any] = {
-    "welcome_message": """Welcome to TROOPERS! So glad you're here! 😊
+    "welcome_message": f"""Welcome to TROOPERS! So glad you're here! 😊
 
-To get started and recommend the best team mix for your project, could you please tell me what kind of project or event you are planning? For example, is it a Café/Restaurant Service, Retail Promotion, Roadshow, Warehouse Operations, or something else? This helps me tailor the roles to your needs.""",
+To get started and recommend the best team mix for your project, could you please tell me what kind of project or event you are planning? For example, is it a {", ".join(QUICK_REPLIES)}, or something else? This helps me tailor the roles to your needs.""",
     "input_placeholder": "Ask about part-time jobs, hiring, or anything else...",
     "timeout_seconds": 30,
     "retry_attempts": 3,
+    "quick_replies": QUICK_REPLIES,
+}
+
+# Quick Reply Prefetch Configuration
+PREFETCH_CONFIG: Dict[str, Any] = {
+    "max_workers": 4,  # Concurrent speculative webhook calls
+    "max_in_flight": 16,  # Queued or running prefetches across all sessions
+    "ttl_seconds": 600,  # Unused prefetches are dropped after 10 minutes
+}
+
+# Session Lifecycle Configuration
+SESSION_CONFIG: Dict[str, Any] = {
+    "spill_dir": os.getenv(
+        "SESSION_SPILL_DIR", os.path.join(os.path.dirname(__file__), "sessions")
+    ),
+    "idle_after_seconds": 300,  # Session counts as idle after 5 minutes
+    "spill_after_seconds": 1800,  # Idle sessions move to disk after 30 minutes
+    "eviction_grace_seconds": 60,  # Never evict sessions active this recently
+    "memory_budget_bytes": int(os.getenv("SESSION_MEMORY_BUDGET_BYTES", 50_000_000)),
+    "spill_ttl_seconds": 7 * 24 * 3600,  # Spilled sessions are deleted after a week
+    "sweep_interval_seconds": 60,  # How often the background sweep runs
 }
 
 # Styling Configuration
@@ -0,0 +1,212 @@
+"""Speculative prefetching of quick-reply answers for the TROOPERS chatbot"""
+
+import logging
+import threading
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from typing import Callable, Dict, Any, List, Optional, Set, Tuple
+from config import PREFETCH_CONFIG
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize(message: str) -> str:
+    return message.strip().lower()
+
+
+class QuickReplyPrefetcher:
+    """
+    Fetch the answers behind quick-reply buttons before they are clicked
+
+    Each prefetch is sent under its own speculative session ID, so the
+    agent's memory for the real session is never polluted by answers the
+    user did not choose. On a hit, the caller should switch to the returned
+    speculative session ID, whose history then matches the conversation.
+
+    Every issued prefetch ends up in exactly one bucket: used (``hits`` or
+    ``late_hits``), ``cancelled`` or ``expired`` before it was sent, or
+    ``wasted`` when the webhook call went out but its answer was not used.
+    ``max_in_flight`` bounds webhook load: queued and running calls,
+    including abandoned ones. Finished answers waiting to be claimed do not
+    count; they are dropped on ``cancel`` or after ``ttl_seconds``.
+    """
+
+    def __init__(
+        self,
+        fetch: Callable[[str, str], Dict[str, Any]],
+        max_workers: int = PREFETCH_CONFIG["max_workers"],
+        max_in_flight: int = PREFETCH_CONFIG["max_in_flight"],
+        ttl_seconds: float = PREFETCH_CONFIG["ttl_seconds"],
+    ):
+        self.fetch = fetch
+        self.max_in_flight = max_in_flight
+        self.ttl_seconds = ttl_seconds
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="quick-reply-prefetch"
+        )
+        self._pending: Dict[str, Dict[str, Dict[str, Any]]] = {}
+        self._abandoned: Set[Future] = set()
+        self._lock = threading.Lock()
+        self._stats = {
+            "issued": 0,
+            "skipped": 0,
+            "hits": 0,
+            "late_hits": 0,
+            "misses": 0,
+            "failed": 0,
+            "cancelled": 0,
+            "expired": 0,
+            "wasted": 0,
+        }
+
+    def start(self, session_id: str, choices: List[str]) -> None:
+        """
+        Begin fetching the answer to each choice in the background
+
+        Args:
+            session_id: Session the quick replies are offered in
+            choices: Messages the quick-reply buttons would send
+        """
+        with self._lock:
+            self._expire(time.time())
+            self._cancel(session_id)
+
+            entries = {}
+            for i, choice in enumerate(choices):
+                if self._in_flight_count() + len(entries) >= self.max_in_flight:
+                    self._stats["skipped"] += len(choices) - i
+                    logger.info(f"Prefetch budget reached, skipping {choice!r}")
+                    break
+
+                # A fresh ID per prefetch, so a restarted session never reuses
+                # a speculative session the agent already has memory for
+                speculative_session_id = (
+                    f"session_{int(time.time())}_{str(uuid.uuid4())[:8]}"
+                )
+                entries[_normalize(choice)] = {
+                    "future": self._executor.submit(
+                        self.fetch, choice, speculative_session_id
+                    ),
+                    "session_id": speculative_session_id,
+                    "created": time.time(),
+                }
+                self._stats["issued"] += 1
+
+            if entries:
+                self._pending[session_id] = entries
+
+    def claim(
+        self, session_id: str, message: str, timeout: float
+    ) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """
+        Take the prefetched answer for a message, releasing all other prefetches
+
+        Args:
+            session_id: Session the message was sent in
+            message: The user's message
+            timeout: Seconds to wait for a prefetch that is still in flight
+
+        Returns:
+            (speculative session ID, webhook response) on a hit, otherwise None
+        """
+        with self._lock:
+            self._expire(time.time())
+            entries = self._pending.pop(session_id, None)
+            if entries is None:
+                return None
+
+            entry = entries.pop(_normalize(message), None)
+            # Free the workers before waiting on the chosen prefetch
+            for other in entries.values():
+                self._release(other["future"], "cancelled")
+
+            if entry is None:
+                self._stats["misses"] += 1
+                return None
+
+            future: Future = entry["future"]
+            if not future.running() and not future.done() and future.cancel():
+                # Still queued behind other work; sending directly is faster
+                self._stats["cancelled"] += 1
+                self._stats["misses"] += 1
+                return None
+            was_ready = future.done()
+
+        try:
+            response = future.result(timeout=timeout)
+        except TimeoutError:
+            response = None
+        except Exception as e:
+            logger.error(f"Prefetch for {message!r} raised: {e}")
+            response = {"success": False}
+
+        with self._lock:
+            if response is None or not response.get("success"):
+                if response is not None:
+                    self._stats["failed"] += 1
+                self._release(future, "cancelled")
+                self._stats["misses"] += 1
+                return None
+            self._stats["hits" if was_ready else "late_hits"] += 1
+
+        return entry["session_id"], response
+
+    def cancel(self, session_id: str) -> None:
+        """Drop any unused prefetches for a session"""
+        with self._lock:
+            self._cancel(session_id)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Report prefetch counters and hit rate"""
+        with self._lock:
+            self._expire(time.time())
+            stats: Dict[str, Any] = dict(self._stats)
+            stats["pending"] = sum(len(e) for e in self._pending.values())
+            stats["in_flight"] = self._in_flight_count()
+
+        served = stats["hits"] + stats["late_hits"]
+        claimed = served + stats["misses"]
+        stats["hit_rate"] = served / claimed if claimed else 0.0
+        return stats
+
+    def _cancel(self, session_id: str) -> None:
+        """Cancel a session's prefetches. Caller holds the lock."""
+        entries = self._pending.pop(session_id, None)
+        if entries:
+            for entry in entries.values():
+                self._release(entry["future"], "cancelled")
+
+    def _expire(self, now: float) -> None:
+        """Drop prefetches older than the TTL. Caller holds the lock."""
+        for session_id, entries in list(self._pending.items()):
+            for key, entry in list(entries.items()):
+                if now - entry["created"] >= self.ttl_seconds:
+                    self._release(entry["future"], "expired")
+                    del entries[key]
+            if not entries:
+                del self._pending[session_id]
+
+    def _release(self, future: Future, reason: str) -> None:
+        """
+        Give up on an unused prefetch. Caller holds the lock.
+
+        Counts it under ``reason`` only if it never reached the webhook.
+        """
+        if future.cancel():
+            self._stats[reason] += 1
+            return
+        self._stats["wasted"] += 1
+        if not future.done():
+            self._abandoned.add(future)
+
+    def _in_flight_count(self) -> int:
+        """Queued or running webhook calls. Caller holds the lock."""
+        self._abandoned = {f for f in self._abandoned if not f.done()}
+        held = sum(
+            not entry["future"].done()
+            for entries in self._pending.values()
+            for entry in entries.values()
+        )
+        return held + len(self._abandoned)
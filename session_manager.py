@@ -0,0 +1,487 @@
+"""Session lifecycle management for the TROOPERS chatbot"""
+
+import atexit
+import json
+import logging
+import os
+import re
+import shutil
+import socket
+import threading
+import time
+import uuid
+import weakref
+from datetime import datetime
+from typing import Callable, Dict, Any, List, Optional, Tuple
+from config import SESSION_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Session IDs become file names, so only accept the format we generate
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]+$")
+
+
+class MessageHistory(list):
+    """A message list the session manager can reference weakly"""
+
+    __slots__ = ("__weakref__",)
+
+
+def _check_history(messages: List[Dict[str, Any]]) -> None:
+    if not isinstance(messages, MessageHistory):
+        raise TypeError(
+            f"Session messages must be a MessageHistory, not {type(messages).__name__}"
+        )
+
+
+def estimate_messages_size(messages: List[Dict[str, Any]]) -> int:
+    """Estimate the memory footprint of a message list in bytes"""
+    return len(json.dumps(serialize_messages(messages)).encode("utf-8"))
+
+
+def serialize_messages(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Convert messages into a JSON-safe list"""
+    serialized = []
+    for message in messages:
+        item = dict(message)
+        if isinstance(item.get("timestamp"), datetime):
+            item["timestamp"] = item["timestamp"].isoformat()
+        serialized.append(item)
+    return serialized
+
+
+def deserialize_messages(data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """Restore messages written by serialize_messages"""
+    messages = []
+    for item in data:
+        message = dict(item)
+        if isinstance(message.get("timestamp"), str):
+            try:
+                message["timestamp"] = datetime.fromisoformat(message["timestamp"])
+            except ValueError:
+                message["timestamp"] = datetime.now()
+        messages.append(message)
+    return messages
+
+
+class SessionManager:
+    """
+    Track chat sessions across the process and keep their memory bounded
+
+    Each script run brackets its work with ``activate`` and ``release``.
+    Between runs, the manager may spill an idle session: its history is
+    written to disk and the list is emptied in place, so a browser tab left
+    open no longer pins it in memory. The next ``activate`` refills the same
+    list from disk. Sessions are never spilled while a run is in flight.
+    Spilling happens on a background sweeper, and files are read and
+    written outside the manager's lock so no script run waits on disk I/O.
+
+    Lists are held by weak reference only, so when Streamlit drops a closed
+    session's state the history is freed and the manager forgets it.
+
+    Each process spills into its own subdirectory of ``spill_dir``, removed
+    on exit. A spill file is only readable by the process that wrote it, so
+    on start every file left by a dead process is deleted.
+    """
+
+    def __init__(
+        self,
+        spill_dir: str = SESSION_CONFIG["spill_dir"],
+        idle_after_seconds: float = SESSION_CONFIG["idle_after_seconds"],
+        spill_after_seconds: float = SESSION_CONFIG["spill_after_seconds"],
+        eviction_grace_seconds: float = SESSION_CONFIG["eviction_grace_seconds"],
+        memory_budget_bytes: int = SESSION_CONFIG["memory_budget_bytes"],
+        spill_ttl_seconds: float = SESSION_CONFIG["spill_ttl_seconds"],
+        sweep_interval_seconds: float = SESSION_CONFIG["sweep_interval_seconds"],
+        on_forget: Optional[Callable[[str], None]] = None,
+    ):
+        self.spill_root = spill_dir
+        self.spill_dir = os.path.join(
+            spill_dir, f"{socket.gethostname()}_{os.getpid()}_{uuid.uuid4().hex[:8]}"
+        )
+        self.idle_after_seconds = idle_after_seconds
+        self.spill_after_seconds = spill_after_seconds
+        self.eviction_grace_seconds = eviction_grace_seconds
+        self.memory_budget_bytes = memory_budget_bytes
+        self.spill_ttl_seconds = spill_ttl_seconds
+        self.on_forget = on_forget
+
+        self._sessions: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+
+        os.makedirs(self.spill_dir, exist_ok=True)
+        self._clear_stale_spills(time.time())
+        atexit.register(self.close)
+
+        if sweep_interval_seconds > 0:
+            threading.Thread(
+                target=self._sweep_loop,
+                args=(sweep_interval_seconds,),
+                name="session-sweeper",
+                daemon=True,
+            ).start()
+
+    def activate(self, session_id: str, messages: MessageHistory) -> None:
+        """
+        Mark a script run as started, restoring the history if it was spilled
+
+        Args:
+            session_id: Unique session identifier
+            messages: The session's live message list (restored in place)
+        """
+        if not SESSION_ID_PATTERN.match(session_id):
+            raise ValueError(f"Invalid session id: {session_id!r}")
+        _check_history(messages)
+
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            restore = entry is not None and entry["spilled"]
+            if entry is None or restore:
+                # Size is recorded by release at the end of the run
+                entry = self._track(session_id, messages, 0)
+
+            # Abort any spill the sweeper is still writing
+            entry["spilling"] = False
+            entry["ref"] = weakref.ref(messages)
+            entry["in_flight"] += 1
+            entry["last_active"] = time.time()
+
+        # The run is now in flight, so the sweeper leaves the list alone
+        if restore:
+            restored = self._load_spill(session_id)
+            if restored is not None:
+                messages[:] = restored
+                logger.info(f"Restored session {session_id} from disk")
+            self._remove_spill(session_id)
+
+    def release(self, session_id: str, messages: MessageHistory) -> None:
+        """
+        Mark a script run as finished and record the session's current size
+
+        Args:
+            session_id: Session identifier at the end of the run
+            messages: The session's message list at the end of the run
+        """
+        _check_history(messages)
+        size = estimate_messages_size(messages)
+        with self._lock:
+            entry = self._sessions.get(session_id)
+            if entry is None:
+                # The run switched to a new session ID
+                entry = self._track(session_id, messages, size)
+            else:
+                entry["in_flight"] = max(entry["in_flight"] - 1, 0)
+
+            entry["ref"] = weakref.ref(messages)
+            entry["bytes"] = size
+            entry["last_active"] = time.time()
+
+            if self._memory_used() > self.memory_budget_bytes:
+                self._wake.set()
+
+    def discard(self, session_id: str) -> None:
+        """
+        Stop tracking a session and delete any spilled copy
+
+        The live message list is left untouched so callers may keep using it.
+        """
+        with self._lock:
+            entry = self._sessions.pop(session_id, None)
+        if entry is not None and (entry["spilled"] or entry["spilling"]):
+            self._remove_spill(session_id)
+        self._notify_forget(session_id)
+
+    def sweep(self) -> None:
+        """Spill idle sessions, enforce the memory budget and prune old files"""
+        now = time.time()
+        with self._lock:
+            closed = self._forget_closed()
+            victims = self._select_victims(now)
+
+        for session_id, entry in closed:
+            if entry["spilled"]:
+                self._remove_spill(session_id)
+            self._notify_forget(session_id)
+        for session_id, entry, snapshot in victims:
+            self._spill(session_id, entry, snapshot)
+        self._prune_spill_dir(now)
+
+    def close(self) -> None:
+        """Stop the background sweep and delete this process's spill files"""
+        self._stop.set()
+        self._wake.set()
+        shutil.rmtree(self.spill_dir, ignore_errors=True)
+
+    def get_stats(self) -> Dict[str, int]:
+        """Report live, idle and spilled session counts and bytes"""
+        now = time.time()
+        stats = {
+            "live_sessions": 0,
+            "live_bytes": 0,
+            "idle_sessions": 0,
+            "idle_bytes": 0,
+            "spilled_sessions": 0,
+            "spilled_bytes": 0,
+        }
+        with self._lock:
+            for entry in self._sessions.values():
+                if entry["spilled"]:
+                    bucket = "spilled"
+                elif (
+                    not entry["in_flight"]
+                    and now - entry["last_active"] >= self.idle_after_seconds
+                ):
+                    bucket = "idle"
+                else:
+                    bucket = "live"
+                stats[f"{bucket}_sessions"] += 1
+                stats[f"{bucket}_bytes"] += entry["bytes"]
+        stats["memory_budget_bytes"] = self.memory_budget_bytes
+        return stats
+
+    def _track(
+        self, session_id: str, messages: MessageHistory, size: int
+    ) -> Dict[str, Any]:
+        """Start tracking a session. Caller holds the lock."""
+        entry = {
+            "ref": weakref.ref(messages),
+            "last_active": time.time(),
+            "bytes": size,
+            "in_flight": 0,
+            "spilling": False,
+            "spilled": False,
+        }
+        self._sessions[session_id] = entry
+        return entry
+
+    def _sweep_loop(self, interval: float) -> None:
+        while not self._stop.is_set():
+            # Woken early by release when the memory budget is exceeded
+            self._wake.wait(interval)
+            self._wake.clear()
+            if self._stop.is_set():
+                break
+            try:
+                self.sweep()
+            except Exception as e:
+                logger.error(f"Session sweep failed: {e}")
+
+    def _notify_forget(self, session_id: str) -> None:
+        if self.on_forget is None:
+            return
+        try:
+            self.on_forget(session_id)
+        except Exception as e:
+            logger.error(f"on_forget failed for session {session_id}: {e}")
+
+    def _memory_used(self) -> int:
+        """Bytes of history held in memory. Caller holds the lock."""
+        return sum(e["bytes"] for e in self._sessions.values() if not e["spilled"])
+
+    def _forget_closed(self) -> List[Tuple[str, Dict[str, Any]]]:
+        """Drop sessions whose Streamlit state is gone. Caller holds the lock."""
+        closed = []
+        for session_id, entry in list(self._sessions.items()):
+            if entry["ref"]() is None:
+                del self._sessions[session_id]
+                closed.append((session_id, entry))
+                logger.info(f"Forgot closed session {session_id}")
+        return closed
+
+    def _select_victims(
+        self, now: float
+    ) -> List[Tuple[str, Dict[str, Any], List[Dict[str, Any]]]]:
+        """
+        Pick sessions to spill and snapshot their messages. Caller holds the lock.
+
+        Picks sessions idle for too long, then least recently used sessions
+        until the memory budget is met. Sessions with a run in flight are
+        never picked.
+        """
+        victims = []
+
+        def take(session_id: str, entry: Dict[str, Any]) -> None:
+            messages = entry["ref"]()
+            if messages is not None:
+                entry["spilling"] = True
+                victims.append((session_id, entry, list(messages)))
+
+        def spillable(entry: Dict[str, Any], min_idle: float) -> bool:
+            return (
+                not entry["spilled"]
+                and not entry["spilling"]
+                and not entry["in_flight"]
+                and now - entry["last_active"] >= min_idle
+            )
+
+        # Spill sessions that have been idle for too long
+        for session_id, entry in self._sessions.items():
+            if spillable(entry, self.spill_after_seconds):
+                take(session_id, entry)
+
+        # Spill least recently used sessions until we are under budget
+        used = self._memory_used() - sum(entry["bytes"] for _, entry, _ in victims)
+        if used > self.memory_budget_bytes:
+            candidates = sorted(
+                (
+                    (session_id, entry)
+                    for session_id, entry in self._sessions.items()
+                    if spillable(entry, self.eviction_grace_seconds)
+                ),
+                key=lambda item: item[1]["last_active"],
+            )
+            for session_id, entry in candidates:
+                if used <= self.memory_budget_bytes:
+                    break
+                take(session_id, entry)
+                used -= entry["bytes"]
+
+            if used > self.memory_budget_bytes:
+                logger.warning(
+                    f"Session memory {used} bytes exceeds budget "
+                    f"{self.memory_budget_bytes} bytes; remaining sessions are active"
+                )
+
+        return victims
+
+    def _spill_path(self, session_id: str) -> str:
+        return os.path.join(self.spill_dir, f"{session_id}.json")
+
+    def _spill(
+        self,
+        session_id: str,
+        entry: Dict[str, Any],
+        snapshot: List[Dict[str, Any]],
+    ) -> None:
+        """
+        Write a session to disk, then release its messages if still idle
+
+        The file is written without holding the lock. If the session was
+        activated or discarded meanwhile, the spill is abandoned.
+        """
+        path = self._spill_path(session_id)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(serialize_messages(snapshot), f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.error(f"Failed to spill session {session_id}: {e}")
+            with self._lock:
+                entry["spilling"] = False
+            return
+
+        with self._lock:
+            messages = entry["ref"]()
+            committed = (
+                entry["spilling"]
+                and self._sessions.get(session_id) is entry
+                and messages is not None
+            )
+            entry["spilling"] = False
+            if committed:
+                # Empty the list in place so st.session_state stops pinning it
+                messages.clear()
+                entry["spilled"] = True
+
+        if committed:
+            logger.info(
+                f"Spilled session {session_id} ({entry['bytes']} bytes) to disk"
+            )
+        else:
+            self._remove_spill(session_id)
+
+    def _load_spill(self, session_id: str) -> Optional[List[Dict[str, Any]]]:
+        path = self._spill_path(session_id)
+        if not os.path.exists(path):
+            return None
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return deserialize_messages(json.load(f))
+        except (OSError, ValueError) as e:
+            logger.error(f"Failed to restore session {session_id}: {e}")
+            return None
+
+    def _remove_spill(self, session_id: str) -> None:
+        try:
+            os.remove(self._spill_path(session_id))
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            logger.warning(f"Failed to remove spilled session {session_id}: {e}")
+
+    def _prune_spill_dir(self, now: float) -> None:
+        """Delete spill files older than the TTL, tracked or not"""
+        try:
+            names = os.listdir(self.spill_dir)
+        except OSError as e:
+            logger.warning(f"Failed to list spill directory: {e}")
+            return
+
+        for name in names:
+            if not name.endswith((".json", ".tmp")):
+                continue
+            path = os.path.join(self.spill_dir, name)
+            try:
+                if now - os.path.getmtime(path) >= self.spill_ttl_seconds:
+                    os.remove(path)
+                    logger.info(f"Pruned expired spill file {name}")
+            except OSError:
+                continue
+
+        with self._lock:
+            for session_id, entry in list(self._sessions.items()):
+                if entry["spilled"] and not os.path.exists(
+                    self._spill_path(session_id)
+                ):
+                    del self._sessions[session_id]
+
+    def _clear_stale_spills(self, now: float) -> None:
+        """Delete spill files this process cannot restore"""
+        try:
+            names = os.listdir(self.spill_root)
+        except OSError as e:
+            logger.warning(f"Failed to list spill directory: {e}")
+            return
+
+        for name in names:
+            path = os.path.join(self.spill_root, name)
+            if path == self.spill_dir:
+                continue
+            try:
+                if os.path.isdir(path):
+                    if self._is_stale_process_dir(name, path, now):
+                        shutil.rmtree(path)
+                        logger.info(f"Removed stale spill directory {name}")
+                elif name.endswith((".json", ".tmp")):
+                    os.remove(path)
+                    logger.info(f"Removed stale spill file {name}")
+            except OSError as e:
+                logger.warning(f"Failed to remove stale spill {name}: {e}")
+
+    def _is_stale_process_dir(self, name: str, path: str, now: float) -> bool:
+        """Whether a spill subdirectory belongs to a process that is gone"""
+        parts = name.rsplit("_", 2)
+        if len(parts) != 3 or not parts[1].isdigit():
+            return False  # Not one of ours
+
+        hostname, pid = parts[0], int(parts[1])
+        if hostname == socket.gethostname():
+            # Our own PID means an earlier process that reused it
+            return pid == os.getpid() or not _pid_alive(pid)
+        # Another replica sharing the directory; only its TTL tells us
+        return now - os.path.getmtime(path) >= self.spill_ttl_seconds
+
+
+def _pid_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    except OSError:
+        return False
+    return True
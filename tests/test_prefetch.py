@@ -0,0 +1,202 @@
+"""Tests for speculative quick-reply prefetching"""
+
+import threading
+import time
+
+from prefetch import QuickReplyPrefetcher
+
+CHOICES = ["Retail Promotion", "Roadshow"]
+
+
+class FakeWebhook:
+    """Webhook stand-in whose calls block until released"""
+
+    def __init__(self, success=True):
+        self.success = success
+        self.calls = []
+        self.release = threading.Event()
+
+    def __call__(self, message, session_id):
+        self.calls.append((message, session_id))
+        self.release.wait(5)
+        return {"success": self.success, "content": f"answer to {message}"}
+
+
+def wait_until(predicate):
+    deadline = time.time() + 5
+    while not predicate() and time.time() < deadline:
+        time.sleep(0.01)
+
+
+def wait_for_calls(webhook, count):
+    wait_until(lambda: len(webhook.calls) >= count)
+
+
+def test_ready_prefetch_is_a_hit():
+    webhook = FakeWebhook()
+    webhook.release.set()
+    prefetcher = QuickReplyPrefetcher(webhook, max_workers=2)
+    prefetcher.start("session_a", CHOICES)
+    wait_until(lambda: prefetcher.get_stats()["in_flight"] == 0)
+
+    speculative_session_id, response = prefetcher.claim(
+        "session_a", " retail promotion", timeout=1
+    )
+
+    assert speculative_session_id != "session_a"
+    assert (CHOICES[0], speculative_session_id) in webhook.calls
+    assert response["content"] == "answer to Retail Promotion"
+    stats = prefetcher.get_stats()
+    assert stats["hits"] == 1
+    assert stats["wasted"] == 1  # The Roadshow answer was fetched for nothing
+    assert stats["hit_rate"] == 1.0
+
+
+def test_in_flight_prefetch_is_a_late_hit():
+    webhook = FakeWebhook()
+    prefetcher = QuickReplyPrefetcher(webhook, max_workers=2)
+    prefetcher.start("session_a", CHOICES)
+    wait_for_calls(webhook, 2)
+
+    def release_once_claim_is_waiting():
+        # Siblings are released under the same lock that decides the
+        # chosen prefetch is not ready, so this fires only afterwards
+        wait_until(lambda: prefetcher.get_stats()["wasted"] == 1)
+        webhook.release.set()
+
+    threading.Thread(target=release_once_claim_is_waiting).start()
+    assert prefetcher.claim("session_a", "Roadshow", timeout=1) is not None
+    assert prefetcher.get_stats()["late_hits"] == 1
+
+
+def test_queued_prefetch_is_not_waited_on():
+    webhook = FakeWebhook()
+    prefetcher = QuickReplyPrefetcher(webhook, max_workers=1)
+    prefetcher.start("session_a", CHOICES)
+    wait_for_calls(webhook, 1)
+
+    started = time.time()
+    assert prefetcher.claim("session_a", "Roadshow", timeout=5) is None
+    assert time.time() - started < 1
+
+    stats = prefetcher.get_stats()
+    assert stats["misses"] == 1
+    assert stats["late_hits"] == 0
+    assert stats["cancelled"] == 1  # The queued Roadshow call never went out
+    assert stats["wasted"] == 1  # Retail Promotion was already running
+    webhook.release.set()
+
+
+def test_free_text_is_a_miss_and_cancels_queued_prefetches():
+    webhook = FakeWebhook()
+    prefetcher = QuickReplyPrefetcher(webhook, max_workers=1)
+    prefetcher.start("session_a", CHOICES)
+    wait_for_calls(webhook, 1)
+
+    assert prefetcher.claim("session_a", "Something else", timeout=1) is None
+    webhook.release.set()
+
+    stats = prefetcher.get_stats()
+    assert stats["misses"] == 1
+    assert stats["cancelled"] == 1
+    assert stats["wasted"] == 1
+    assert stats["hit_rate"] == 0.0
+
+
+def test_timed_out_prefetch_is_a_miss():
+    webhook = FakeWebhook()
+    prefetcher = QuickReplyPrefetcher(webhook, max_workers=2)
+    prefetcher.start("session_a", CHOICES)
+    wait_for_calls(webhook, 2)
+
+    assert prefetcher.claim("session_a", "Roadshow", timeout=0.05) is None
+    stats = prefetcher.get_stats()
+    assert stats["misses"] == 1
+    assert stats["wasted"] == 2
+    webhook.release.set()
+
+
+def test_failed_prefetch_is_a_miss():
+    webhook = FakeWebhook(success=False)
+    webhook.release.set()
+    prefetcher = QuickReplyPrefetcher(webhook, max_workers=2)
+    prefetcher.start("session_a", CHOICES)
+    wait_for_calls(webhook, 2)
+
+    assert prefetcher.claim("session_a", "Roadshow", timeout=1) is None
+    stats = prefetcher.get_stats()
+    assert stats["failed"] == 1
+    assert stats["misses"] == 1
+
+
+def test_unused_prefetches_expire():
+    webhook = FakeWebhook()
+    prefetcher = QuickReplyPrefetcher(webhook, max_workers=1, ttl_seconds=0)
+    prefetcher.start("session_a", CHOICES)
+    wait_for_calls(webhook, 1)
+
+    stats = prefetcher.get_stats()
+    assert stats["expired"] == 1
+    assert stats["wasted"] == 1
+    assert prefetcher.claim("session_a", "Roadshow", timeout=1) is None
+    webhook.release.set()
+
+
+def test_budget_counts_abandoned_running_calls():
+    webhook = FakeWebhook()
+    prefetcher = QuickReplyPrefetcher(webhook, max_workers=2, max_in_flight=2)
+    prefetcher.start("session_a", CHOICES)
+    wait_for_calls(webhook, 2)
+
+    # Restarting abandons two running calls, which still hold the budget
+    prefetcher.start("session_a", CHOICES)
+    stats = prefetcher.get_stats()
+    assert stats["skipped"] == 2
+    assert stats["in_flight"] == 2
+
+    webhook.release.set()
+    wait_until(lambda: prefetcher.get_stats()["in_flight"] == 0)
+    prefetcher.start("session_a", CHOICES)
+    assert prefetcher.get_stats()["issued"] == 4
+
+
+def test_unclaimed_answers_do_not_hold_the_budget():
+    webhook = FakeWebhook()
+    webhook.release.set()
+    prefetcher = QuickReplyPrefetcher(webhook, max_workers=2, max_in_flight=2)
+    for i in range(5):
+        prefetcher.start(f"session_{i}", CHOICES)
+        wait_until(lambda: prefetcher.get_stats()["in_flight"] == 0)
+
+    stats = prefetcher.get_stats()
+    assert stats["issued"] == 10
+    assert stats["skipped"] == 0
+    assert stats["pending"] == 10
+
+    prefetcher.cancel("session_0")
+    assert prefetcher.get_stats()["pending"] == 8
+
+
+def test_restart_uses_fresh_speculative_sessions():
+    webhook = FakeWebhook()
+    webhook.release.set()
+    prefetcher = QuickReplyPrefetcher(webhook, max_workers=2)
+    prefetcher.start("session_a", CHOICES)
+    wait_for_calls(webhook, 2)
+    prefetcher.start("session_a", CHOICES)
+    wait_for_calls(webhook, 4)
+
+    assert len({session_id for _, session_id in webhook.calls}) == 4
+
+
+def test_speculative_ids_do_not_grow_across_restarts():
+    webhook = FakeWebhook()
+    webhook.release.set()
+    prefetcher = QuickReplyPrefetcher(webhook, max_workers=2)
+    session_id = "session_1700000000_abcdef12"
+    for _ in range(30):
+        prefetcher.start(session_id, CHOICES)
+        wait_until(lambda: prefetcher.get_stats()["in_flight"] == 0)
+        session_id, _ = prefetcher.claim(session_id, "Roadshow", timeout=5)
+
+    assert len(session_id) == len("session_1700000000_abcdef12")
@@ -0,0 +1,225 @@
+"""Tests for session lifecycle management"""
+
+import gc
+import os
+import socket
+import time
+from datetime import datetime
+from pathlib import Path
+
+import pytest
+
+import session_manager
+from session_manager import MessageHistory, SessionManager
+
+
+def make_manager(tmp_path, **overrides):
+    settings = {
+        "spill_dir": str(tmp_path),
+        "idle_after_seconds": 3600,
+        "spill_after_seconds": 3600,
+        "eviction_grace_seconds": 0,
+        "memory_budget_bytes": 10_000_000,
+        "spill_ttl_seconds": 3600,
+        "sweep_interval_seconds": 0,
+    }
+    settings.update(overrides)
+    return SessionManager(**settings)
+
+
+def make_history(*contents):
+    return MessageHistory(
+        {"role": "user", "content": content, "timestamp": datetime(2024, 1, 1, 12)}
+        for content in contents
+    )
+
+
+def run(manager, session_id, messages):
+    manager.activate(session_id, messages)
+    manager.release(session_id, messages)
+
+
+def test_spill_and_restore_round_trip(tmp_path):
+    manager = make_manager(tmp_path, spill_after_seconds=0)
+    messages = make_history("welcome", "hi")
+    run(manager, "session_a", messages)
+    assert messages != []  # release never spills itself
+
+    manager.sweep()
+    assert messages == []
+    assert os.path.exists(Path(manager.spill_dir) / "session_a.json")
+    assert manager.get_stats()["spilled_sessions"] == 1
+
+    manager.activate("session_a", messages)
+    assert [m["content"] for m in messages] == ["welcome", "hi"]
+    assert messages[0]["timestamp"] == datetime(2024, 1, 1, 12)
+    assert not os.path.exists(Path(manager.spill_dir) / "session_a.json")
+
+
+def test_in_flight_session_is_never_spilled(tmp_path):
+    manager = make_manager(tmp_path, spill_after_seconds=0, memory_budget_bytes=0)
+    messages = make_history("welcome", "hi")
+    manager.activate("session_a", messages)
+
+    # Another session's run sweeps while session_a waits on the webhook
+    run(manager, "session_b", make_history("other"))
+    manager.sweep()
+    messages.append({"role": "assistant", "content": "REPLY"})
+    manager.release("session_a", messages)
+
+    manager.activate("session_a", messages)
+    assert [m["content"] for m in messages] == ["welcome", "hi", "REPLY"]
+
+
+def test_activation_during_spill_write_aborts_the_spill(tmp_path, monkeypatch):
+    manager = make_manager(tmp_path, spill_after_seconds=0)
+    messages = make_history("welcome", "hi")
+    run(manager, "session_a", messages)
+
+    serialize = session_manager.serialize_messages
+
+    def serialize_while_user_returns(snapshot):
+        manager.activate("session_a", messages)
+        return serialize(snapshot)
+
+    monkeypatch.setattr(
+        session_manager, "serialize_messages", serialize_while_user_returns
+    )
+    manager.sweep()
+
+    assert [m["content"] for m in messages] == ["welcome", "hi"]
+    assert manager.get_stats()["spilled_sessions"] == 0
+    assert os.listdir(manager.spill_dir) == []
+
+
+def test_budget_evicts_least_recently_used_first(tmp_path):
+    manager = make_manager(tmp_path)
+    oldest, newer, newest = make_history("a"), make_history("b"), make_history("c")
+    run(manager, "session_old", oldest)
+    time.sleep(0.01)
+    run(manager, "session_new", newer)
+    time.sleep(0.01)
+
+    manager.memory_budget_bytes = 150
+    run(manager, "session_newest", newest)
+    manager.sweep()
+
+    assert oldest == []
+    assert newer != []
+    assert newest != []
+
+
+def test_closed_session_is_forgotten_and_not_spilled(tmp_path):
+    manager = make_manager(tmp_path, spill_after_seconds=0)
+    run(manager, "session_a", make_history("welcome"))
+    gc.collect()
+
+    manager.sweep()
+
+    assert manager.get_stats()["spilled_sessions"] == 0
+    assert os.listdir(manager.spill_dir) == []
+
+
+def test_closed_spilled_session_file_is_removed(tmp_path):
+    manager = make_manager(tmp_path, spill_after_seconds=0)
+    messages = make_history("welcome")
+    run(manager, "session_a", messages)
+    manager.sweep()
+    assert os.path.exists(Path(manager.spill_dir) / "session_a.json")
+
+    del messages
+    gc.collect()
+    manager.sweep()
+
+    assert not os.path.exists(Path(manager.spill_dir) / "session_a.json")
+
+
+def test_spills_from_previous_processes_are_removed_on_start(tmp_path):
+    hostname = socket.gethostname()
+    legacy = tmp_path / "session_old.json"
+    legacy.write_text("[]")
+    dead = tmp_path / f"{hostname}_{os.getpid()}_deadbeef"
+    dead.mkdir()
+    (dead / "session_a.json").write_text("[]")
+    replica = tmp_path / "other-host_123_cafef00d"
+    replica.mkdir()
+    expired_replica = tmp_path / "gone-host_456_0badf00d"
+    expired_replica.mkdir()
+    two_hours_ago = time.time() - 7200
+    os.utime(expired_replica, (two_hours_ago, two_hours_ago))
+    unrelated = tmp_path / "notes"
+    unrelated.mkdir()
+
+    manager = make_manager(tmp_path)
+
+    assert not legacy.exists()
+    assert not dead.exists()
+    assert replica.exists()
+    assert not expired_replica.exists()
+    assert unrelated.exists()
+    assert Path(manager.spill_dir).exists()
+
+
+def test_close_removes_process_spill_dir(tmp_path):
+    manager = make_manager(tmp_path, spill_after_seconds=0)
+    messages = make_history("welcome")
+    run(manager, "session_a", messages)
+
+    manager.close()
+
+    assert not Path(manager.spill_dir).exists()
+
+
+def test_stats_report_live_and_idle_sessions(tmp_path):
+    manager = make_manager(tmp_path, idle_after_seconds=0)
+    live, idle = make_history("live"), make_history("idle")
+    manager.activate("session_live", live)
+    run(manager, "session_idle", idle)
+
+    stats = manager.get_stats()
+    assert stats["live_sessions"] == 1
+    assert stats["idle_sessions"] == 1
+    assert stats["idle_bytes"] > 0
+
+
+def test_invalid_session_id_is_rejected(tmp_path):
+    manager = make_manager(tmp_path)
+    with pytest.raises(ValueError):
+        manager.activate("../etc/passwd", make_history())
+
+
+def test_plain_list_is_rejected(tmp_path):
+    manager = make_manager(tmp_path)
+    with pytest.raises(TypeError):
+        manager.activate("session_a", [])
+    with pytest.raises(TypeError):
+        manager.release("session_a", [])
+
+
+def test_release_over_budget_wakes_the_sweeper(tmp_path):
+    manager = make_manager(
+        tmp_path, memory_budget_bytes=0, sweep_interval_seconds=3600
+    )
+    messages = make_history("welcome")
+    run(manager, "session_a", messages)
+
+    deadline = time.time() + 5
+    while messages and time.time() < deadline:
+        time.sleep(0.01)
+    manager.close()
+
+    assert messages == []
+
+
+def test_forgotten_sessions_are_reported(tmp_path):
+    forgotten = []
+    manager = make_manager(tmp_path, on_forget=forgotten.append)
+    run(manager, "session_closed", make_history("welcome"))
+    kept = make_history("welcome")
+    run(manager, "session_kept", kept)
+    gc.collect()
+
+    manager.sweep()
+    manager.discard("session_kept")
+
+    assert forgotten == ["session_closed", "session_kept"]